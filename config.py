@@ -6,6 +6,8 @@ MODEL_GENERATION = "claude-sonnet-4-20250514"       # For generating responses w
 MODEL_CRITIQUE = "claude-sonnet-4-20250514"         # For critiquing system prompts
 MODEL_REFINEMENT = "claude-sonnet-4-20250514"       # For refining system prompts
 MODEL_CRITIQUE_REFINEMENT = "claude-sonnet-4-20250514"  # For refining critique prompts
+MODEL_VARIATION = "claude-haiku-4-5-20251001"       # For paraphrasing test inputs during cross-validation
+MODEL_CHEAP_CRITIQUE = "claude-haiku-4-5-20251001"  # For scoring old/new prompts during cross-validation
 
 # === IMPROVEMENT PARAMETERS ===
 TARGET_SCORE = 95                             # Target score for system prompt (1-100)
@@ -25,22 +27,59 @@ DETAILED_LOGGING = True                       # Show detailed iteration logs
 # === OUTPUT CONFIGURATION ===
 SAVE_INTERMEDIATE_RESULTS = True              # Save results after each iteration
 OUTPUT_PREFIX = "dual_improvement"            # Prefix for output files
+RESUME_RUN_ID = None                          # Timestamp of an interrupted run to continue, e.g. "20250101_120000"
 
 # === ADVANCED OPTIONS ===
 # Enable/disable specific improvement features
 ENABLE_CRITIQUE_IMPROVEMENT = True            # Whether to improve critique prompts
 ENABLE_SYSTEM_PROMPT_IMPROVEMENT = True       # Whether to improve system prompts
 PARALLEL_EVALUATION = False                   # Future feature: parallel processing
+ENABLE_FUSED_GENCRIT = False                  # Generate + critique in one request (halves round trips, self-graded)
+PIPELINE_GENERATION = True                    # Start next iteration's generation during refinement
+
+# === MESSAGE BATCHES ===
+# Cross-validation calls can go through the Message Batches API (50% cheaper, minutes-to-hours turnaround)
+ENABLE_BATCH_MODE = False
+BATCH_MIN_SIZE = 4                # Submit as soon as this many calls are pooled (capped at one
+                                  # cross-validation fan-out: old + new prompt x VALIDATION_ROUNDS)
+BATCH_LINGER_SECONDS = 2.0        # ...or this long after the first call of a partial pool
+BATCH_POLL_INTERVAL = 5.0         # Seconds between batch status checks
+
+# === API CONCURRENCY & RETRIES ===
+MAX_CONCURRENT_REQUESTS = 5       # Maximum in-flight Anthropic API calls
+API_MAX_RETRIES = 6               # Attempts for rate-limited/overloaded calls
+API_RETRY_BASE_DELAY = 10         # Backoff base in seconds (delay = base * 2**attempt)
+HTTP_MAX_CONNECTIONS = 50         # Pooled HTTP/2 connections to the API
+HTTP_MAX_KEEPALIVE = 20           # Idle connections kept open for reuse
+API_TIMEOUT = 600.0               # Seconds to wait for a full (non-streamed) response
+API_CONNECT_TIMEOUT = 5.0         # Seconds to establish a connection
+
+# === RESPONSE CACHE ===
+ENABLE_RESPONSE_CACHE = True      # Reuse results of identical (model, system, user) calls
+RESPONSE_CACHE_DIR = ".llm_cache" # On-disk cache location (delete to start fresh)
+MEMORY_CACHE_SIZE = 256           # Responses kept in the in-process LRU in front of the disk cache
+ENABLE_SEMANTIC_CACHE = False     # Reuse critiques of near-duplicate responses (needs sentence-transformers)
+SEMANTIC_CACHE_MODEL = "all-MiniLM-L6-v2"  # Local embedding model for the semantic cache
+SEMANTIC_CACHE_THRESHOLD = 0.92   # Minimum response cosine similarity for a semantic cache hit
 
 # === META-EVALUATION CRITERIA WEIGHTS ===
 # These control how the critique prompt itself is evaluated
-META_EVALUATION_WEIGHTS = {
-    "issue_identification": 25,    # How well it identifies real problems
-    "scoring_calibration": 20,     # Appropriateness of scores given
-    "actionability": 25,           # Concrete, actionable suggestions
-    "comprehensiveness": 15,       # Coverage of all important aspects
-    "consistency": 15              # Internal logic and consistency
-}
+# Stored as an immutable tuple of (criterion, weight) pairs
+META_EVALUATION_WEIGHTS = (
+    ("issue_identification", 25),  # How well it identifies real problems
+    ("scoring_calibration", 20),   # Appropriateness of scores given
+    ("actionability", 25),         # Concrete, actionable suggestions
+    ("comprehensiveness", 15),     # Coverage of all important aspects
+    ("consistency", 15),           # Internal logic and consistency
+)
+META_EVALUATION_WEIGHTS_DICT = dict(META_EVALUATION_WEIGHTS)  # Lookup by criterion name
+
+# === OUTPUT TOKEN BUDGETS ===
+# Lower ceilings for short structured outputs cut decode latency
+MAX_TOKENS_GENERATION = 8000      # Responses generated with the system prompt
+MAX_TOKENS_CRITIQUE = 1200        # Score + critique JSON
+MAX_TOKENS_VARIATION = 400        # Per generated test-input variation
+MAX_TOKENS_REFINEMENT = 3000      # Minimum for rewritten system prompts (scaled up with prompt length)
 
 # === PROMPTING STRATEGIES ===
 # Different approaches for different model types
@@ -49,4 +88,6 @@ PROMPTING_STRATEGY = "detailed"  # Options: "detailed", "concise", "chain_of_tho
 # === SAFETY & CONSTRAINTS ===
 MAX_PROMPT_LENGTH = 200000        # Maximum length for prompts (characters) - Claude can handle more
 MIN_SCORE_IMPROVEMENT = 2         # Minimum score improvement to continue
-EARLY_STOPPING_PATIENCE = 3       # Stop if no improvement for N iterations 
\ No newline at end of file
+EARLY_STOPPING_PATIENCE = 3       # Stop if no improvement for N iterations
+EPS_CORRECTION = 0.01             # Converged once score corrections stay below this fraction of the score
+RHO_THRESH = 0.95                 # Diverging once |delta_new / delta_old| stays at or above this without gains 
\ No newline at end of file
@@ -11,11 +11,27 @@ Advanced features:
 """
 
 import os
+import re
 import json
+import array
+import asyncio
+import difflib
+import hashlib
 import logging
+import functools
+import itertools
+from collections import OrderedDict, deque
 import statistics
 from datetime import datetime
-from anthropic import Anthropic
+import diskcache
+import httpx
+from json_repair import repair_json
+from anthropic import AsyncAnthropic, DefaultAsyncHttpxClient, APIConnectionError, APIStatusError
+
+try:
+    import orjson
+except ImportError:  # Fall back to the stdlib json module
+    orjson = None
 
 # Import configuration
 try:
@@ -27,6 +43,8 @@ except ImportError:
     MODEL_CRITIQUE = "claude-sonnet-4-20250514"
     MODEL_REFINEMENT = "claude-sonnet-4-20250514"
     MODEL_CRITIQUE_REFINEMENT = "claude-sonnet-4-20250514"
+    MODEL_VARIATION = "claude-haiku-4-5-20251001"
+    MODEL_CHEAP_CRITIQUE = "claude-haiku-4-5-20251001"
     TARGET_SCORE = 95
     MAX_ITERATIONS = 15
     IMPROVE_CRITIQUE_EVERY = 3
@@ -38,21 +56,361 @@ except ImportError:
     DETAILED_LOGGING = True
     SAVE_INTERMEDIATE_RESULTS = True
     OUTPUT_PREFIX = "enhanced_dual_improvement"
+    RESUME_RUN_ID = None
     ENABLE_CRITIQUE_IMPROVEMENT = True
     ENABLE_SYSTEM_PROMPT_IMPROVEMENT = True
-    META_EVALUATION_WEIGHTS = {
-        "issue_identification": 25,
-        "scoring_calibration": 20,
-        "actionability": 25,
-        "comprehensiveness": 15,
-        "consistency": 15
-    }
+    META_EVALUATION_WEIGHTS = (
+        ("issue_identification", 25),
+        ("scoring_calibration", 20),
+        ("actionability", 25),
+        ("comprehensiveness", 15),
+        ("consistency", 15),
+    )
+    META_EVALUATION_WEIGHTS_DICT = dict(META_EVALUATION_WEIGHTS)
+    MIN_SCORE_IMPROVEMENT = 2
+    MAX_PROMPT_LENGTH = 200000
     EARLY_STOPPING_PATIENCE = 3
+    EPS_CORRECTION = 0.01
+    RHO_THRESH = 0.95
+    MAX_CONCURRENT_REQUESTS = 5
+    API_MAX_RETRIES = 6
+    API_RETRY_BASE_DELAY = 10
+    HTTP_MAX_CONNECTIONS = 50
+    HTTP_MAX_KEEPALIVE = 20
+    API_TIMEOUT = 600.0
+    API_CONNECT_TIMEOUT = 5.0
+    ENABLE_RESPONSE_CACHE = True
+    RESPONSE_CACHE_DIR = ".llm_cache"
+    MEMORY_CACHE_SIZE = 256
+    MAX_TOKENS_GENERATION = 8000
+    MAX_TOKENS_CRITIQUE = 1200
+    MAX_TOKENS_VARIATION = 400
+    MAX_TOKENS_REFINEMENT = 3000
+    ENABLE_FUSED_GENCRIT = False
+    PIPELINE_GENERATION = True
+    ENABLE_BATCH_MODE = False
+    BATCH_MIN_SIZE = 4
+    BATCH_LINGER_SECONDS = 2.0
+    BATCH_POLL_INTERVAL = 5.0
+    ENABLE_SEMANTIC_CACHE = False
+    SEMANTIC_CACHE_MODEL = "all-MiniLM-L6-v2"
+    SEMANTIC_CACHE_THRESHOLD = 0.92
+
+# Optional semantic cache dependencies (pip install sentence-transformers)
+if ENABLE_SEMANTIC_CACHE:
+    import numpy as np
+    from sentence_transformers import SentenceTransformer
 
 # Enhanced configuration
 CONFIDENCE_THRESHOLD = 90  # Minimum confidence in final result
 VALIDATION_ROUNDS = 2      # Cross-validation rounds for improvements
 CRITIQUE_STABILITY_WINDOW = 3  # Window to check critique consistency
+PLATEAU_MARGIN = 5  # Scores within this many points of TARGET_SCORE count as near target
+PLATEAU_SLOPE = 1.0  # Score trend slope (points/iteration) below which the trend is flat
+ROLLBACK_MARGIN = 5  # Revert to the best prompt when the score drops this far below best
+TRIVIAL_EDIT_SIMILARITY = 0.98  # Refinements at least this similar are accepted without cross-validation
+REWRITE_SIMILARITY = 0.3  # Refinements less similar than this are rejected as rewrites
+MAX_LENGTH_CHANGE = 0.5  # ...as are refinements changing the prompt length by more than this fraction
+CROSS_VALIDATION_LATENCY_BUDGET_MS = 600_000  # Cross-validation can wait for batch turnaround
+BATCH_MIN_LATENCY_BUDGET_MS = 60_000  # Calls tolerating at least this much latency may be batched
+MAX_TOKENS_REFINEMENT_CAP = 16000  # Non-streamed requests much above this are refused by the SDK
+HISTORY_WINDOW = max(CRITIQUE_STABILITY_WINDOW, EARLY_STOPPING_PATIENCE) + 2  # Entries kept in memory
+
+# Log banners, built once instead of on every call
+_EQ20, _EQ50, _EQ80 = "=" * 20, "=" * 50, "=" * 80
+
+def _within_budget(prompt, _limit=MAX_PROMPT_LENGTH):
+    """Check a prompt against MAX_PROMPT_LENGTH (limit bound as a default for fast lookup)."""
+    return len(prompt) <= _limit
+
+def _prompt_similarity(old_prompt, new_prompt):
+    """difflib similarity ratio (0-1) between two prompt versions."""
+    return difflib.SequenceMatcher(None, old_prompt, new_prompt).ratio()
+
+class SemanticCritiqueCache:
+    """
+    Slot-aware semantic cache for critique requests.
+    
+    Critique requests are templated as (user input, system prompt, response).
+    The stable slots are hashed, together with the model and critique prompt,
+    into an exact-match scope; only the variable response slot is embedded with
+    a local sentence-transformers model. Within a scope, a cached critique is
+    reused when the cosine similarity of the responses reaches the threshold.
+    """
+    
+    def __init__(self, model_name=SEMANTIC_CACHE_MODEL, threshold=SEMANTIC_CACHE_THRESHOLD):
+        self.embedder = SentenceTransformer(model_name)
+        self.threshold = threshold
+        self.scopes = {}  # scope key -> (embedding matrix, critique list)
+    
+    def embed(self, text):
+        """Return a normalized float32 embedding vector."""
+        return self.embedder.encode(text, normalize_embeddings=True).astype(np.float32)
+    
+    def lookup(self, scope, embedding):
+        """Return the closest cached critique in the scope if it clears the threshold."""
+        if scope not in self.scopes:
+            return None
+        embeddings, critiques = self.scopes[scope]
+        similarities = embeddings @ embedding
+        best = int(similarities.argmax())
+        return critiques[best] if similarities[best] >= self.threshold else None
+    
+    def add(self, scope, embedding, critique):
+        """Insert a response embedding and its critique under the given scope."""
+        if scope in self.scopes:
+            embeddings, critiques = self.scopes[scope]
+            self.scopes[scope] = (np.vstack([embeddings, embedding]), critiques + [critique])
+        else:
+            self.scopes[scope] = (embedding[np.newaxis, :], [critique])
+
+class BatchDispatcher:
+    """
+    Pools latency-tolerant Messages API calls into Message Batches submissions.
+    
+    Each submitted call gets a custom_id and an asyncio.Future. A batch is sent
+    once min_size calls are pooled, or BATCH_LINGER_SECONDS after the first
+    call of a partial pool; it is polled until processing has ended and every
+    result is delivered to its future as a regular Message. If the earliest
+    deadline among its calls passes first, the batch is cancelled and its
+    calls are sent through fallback (a messages.create-style coroutine).
+    """
+    
+    def __init__(self, client, fallback, min_size=BATCH_MIN_SIZE, linger=BATCH_LINGER_SECONDS,
+                 poll_interval=BATCH_POLL_INTERVAL):
+        self.client = client
+        self.fallback = fallback
+        self.min_size = min_size
+        self.linger = linger
+        self.poll_interval = poll_interval
+        self.pending = []  # (custom_id, params, future, deadline)
+        self._ids = itertools.count()
+        self._linger_task = None
+        self._tasks = set()  # strong references to in-flight flush tasks
+    
+    async def submit(self, deadline=None, **params):
+        """
+        Queue one messages.create call and wait for its batched result.
+        
+        deadline is the event-loop time (loop.time()) by which the batch must
+        have ended; None waits for as long as the batch takes.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((f"req-{next(self._ids)}", params, future, deadline))
+        if len(self.pending) >= self.min_size:
+            if self._linger_task is not None:
+                self._linger_task.cancel()
+                self._linger_task = None
+            self._spawn(self.flush())
+        elif self._linger_task is None:
+            self._linger_task = self._spawn(self._flush_after_linger())
+        return await future
+    
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+    
+    async def _flush_after_linger(self):
+        await asyncio.sleep(self.linger)
+        self._linger_task = None
+        await self.flush()
+    
+    async def _send_directly(self, params, future):
+        """Resolve a future through the fallback (non-batched) call."""
+        try:
+            result = await self.fallback(**params)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(result)
+    
+    async def flush(self):
+        """Submit every pooled call as one batch and resolve the futures."""
+        pooled, self.pending = self.pending, []
+        if not pooled:
+            return
+        calls = {custom_id: (params, future) for custom_id, params, future, _ in pooled}
+        deadline = min((d for *_, d in pooled if d is not None), default=None)
+        loop = asyncio.get_running_loop()
+        try:
+            batch = await self.client.messages.batches.create(
+                requests=[{"custom_id": custom_id, "params": params} for custom_id, params, _, _ in pooled]
+            )
+            logging.info("📦 Submitted message batch %s (%d requests)", batch.id, len(pooled))
+            while batch.processing_status != "ended":
+                if deadline is not None and loop.time() >= deadline:
+                    logging.warning("⌛ Batch %s exceeded its latency budget; cancelling and sending "
+                                    "%d requests to /messages", batch.id, len(calls))
+                    try:
+                        await self.client.messages.batches.cancel(batch.id)
+                    except Exception as e:
+                        logging.warning("Could not cancel batch %s: %s", batch.id, e)
+                    await asyncio.gather(*(self._send_directly(params, future)
+                                           for params, future in calls.values()))
+                    return
+                wait = self.poll_interval if deadline is None else min(self.poll_interval, deadline - loop.time())
+                await asyncio.sleep(max(wait, 0))
+                batch = await self.client.messages.batches.retrieve(batch.id)
+            
+            async for entry in await self.client.messages.batches.results(batch.id):
+                _, future = calls.pop(entry.custom_id, (None, None))
+                if future is None or future.done():
+                    continue
+                if entry.result.type == "succeeded":
+                    future.set_result(entry.result.message)
+                else:
+                    future.set_exception(RuntimeError(f"Batch request {entry.custom_id} {entry.result.type}"))
+            error = RuntimeError(f"No result for request in batch {batch.id}")
+        except Exception as e:
+            error = e
+        for _, future in calls.values():
+            if not future.done():
+                future.set_exception(error)
+
+def _create_client():
+    """
+    Create an AsyncAnthropic client.
+    
+    The client multiplexes requests over a pool of keep-alive HTTP/2
+    connections, so concurrent calls skip repeated TCP/TLS handshakes.
+    That pool is bound to the event loop that first uses it: create one
+    client per run and close it when the run ends.
+    """
+    api_key = os.getenv('ANTHROPIC_API_KEY')
+    if not api_key:
+        raise ValueError(
+            "ANTHROPIC_API_KEY environment variable is not set!\n"
+            "Please set it using: export ANTHROPIC_API_KEY='your-api-key'"
+        )
+    
+    try:
+        client = AsyncAnthropic(
+            api_key=api_key,
+            max_retries=0,  # create_message owns retries (API_MAX_RETRIES / API_RETRY_BASE_DELAY)
+            default_headers={"anthropic-beta": "prompt-caching-2024-07-31"},
+            http_client=DefaultAsyncHttpxClient(
+                http2=True,
+                limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS,
+                                    max_keepalive_connections=HTTP_MAX_KEEPALIVE),
+                timeout=httpx.Timeout(API_TIMEOUT, connect=API_CONNECT_TIMEOUT)
+            )
+        )
+        logging.info("Anthropic client initialized successfully")
+    except Exception as e:
+        raise ValueError(f"Failed to initialize Anthropic client: {e}")
+    return client
+
+@functools.lru_cache(maxsize=32)
+def _cached_read(path, mtime):
+    """Read and strip a text file; keyed on mtime so edits invalidate the cache."""
+    with open(path, 'r', encoding='utf-8') as file:
+        return file.read().strip()
+
+JSON_INSTRUCTION = "\nJSON only."
+
+# Critique request = cached prefix (input + prompt under test) + per-response suffix.
+# The brevity instruction is appended since the critique text is all the loop consumes.
+CRITIQUE_PREFIX_TEMPLATE = "User Input: {user_input}\nSystem Prompt: {system_prompt}\n"
+CRITIQUE_RESPONSE_TEMPLATE = (
+    "Response: {response}"
+    "\nRespond in ≤300 words; JSON fields: score (int), critique (string ≤200 words)."
+)
+
+# Static prompt text, built once so repeated calls send byte-identical prefixes
+REFINEMENT_SYSTEM_PROMPT = """
+You are an elite system prompt engineer specializing in transforming good prompts into exceptional ones.
+
+Your task is to refine the given system prompt to address ALL issues identified in the critique while maintaining its core functionality and strengths.
+
+**Improvement Strategy:**
+1. **Address Every Issue**: Systematically fix each problem mentioned in the critique
+2. **Preserve Strengths**: Keep what's working well
+3. **Enhance Clarity**: Make instructions more precise and unambiguous  
+4. **Improve Structure**: Optimize organization and flow
+5. **Add Missing Elements**: Include any crucial components that were absent
+6. **Strengthen Constraints**: Better define boundaries and limitations
+7. **Optimize for AI**: Ensure the prompt works well with AI reasoning patterns
+
+**Quality Standards:**
+- Every instruction should be clear and actionable
+- The prompt should be comprehensive yet efficient
+- It should handle edge cases and ambiguities
+- The structure should facilitate AI understanding
+- All constraints should be explicitly defined
+
+Return ONLY the improved system prompt, ready for immediate deployment.
+"""
+
+# The instructions alone are below Anthropic's minimum cacheable size, so the cache
+# breakpoint goes on this prefix, which carries the (large) prompt being refined
+REFINEMENT_PREFIX_TEMPLATE = """
+CURRENT SYSTEM PROMPT:
+{current_system_prompt}
+"""
+
+REFINEMENT_INPUT_TEMPLATE = """
+CRITIQUE TO ADDRESS:
+{critique_text}
+
+Please provide an improved version that addresses all the issues raised while maintaining the prompt's core purpose and effectiveness.
+"""
+
+VARIATION_SYSTEM_PROMPT = "You are a test case generator. Create realistic variations."
+
+VARIATION_PROMPT_TEMPLATE = """
+Generate {count} variations of this user input that test similar capabilities:
+
+Original: {user_input}
+
+Return as JSON array: ["variation1", "variation2", ...]
+"""
+
+# Single-request generation + critique, sent with the critique prompt as system prompt
+FUSED_GENCRIT_TEMPLATE = """Step 1: Act as an assistant operating under the SYSTEM PROMPT below and write its response to the USER INPUT.
+Step 2: Using your evaluation rubric, critique the system prompt as evidenced by that response and score it from 1 to 100.
+
+SYSTEM PROMPT:
+{system_prompt}
+
+USER INPUT:
+{user_input}
+
+Return JSON: {{"response": "<step 1 response>", "score": <int>, "critique": "<step 2 critique>"}}"""
+
+_json_loads = orjson.loads if orjson else json.loads  # Accepts str or bytes
+
+def _json_dumps(obj):
+    """Serialize to compact UTF-8 JSON bytes (orjson when installed)."""
+    if orjson:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode()
+
+# Outermost JSON object or array in a model response (ignores prose and code fences)
+_JSON_RE = re.compile(r"[\{\[].*[\}\]]", re.DOTALL)
+
+def _parse_json(content):
+    """Parse JSON from a model response, repairing minor syntax errors before giving up."""
+    match = _JSON_RE.search(content)
+    candidate = match.group(0) if match else content
+    try:
+        return _json_loads(candidate)
+    except json.JSONDecodeError:  # orjson.JSONDecodeError subclasses it
+        repaired = repair_json(candidate, return_objects=True)
+        if repaired == "":
+            raise ValueError("No parseable JSON in model response")
+        logging.warning("⚠️ Repaired malformed JSON in model response")
+        return repaired
+
+# Prompts above this many characters are hashed off the event loop
+_OFFLOAD_HASH_CHARS = 32000
+
+def _digest(text):
+    """16-byte blake2b hex digest used for cache keys."""
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
 
 # Set up logging
 logging.basicConfig(
@@ -67,93 +425,350 @@ class EnhancedDualPromptImprover:
     
     def __init__(self):
         """Initialize the enhanced improver."""
-        self.setup_client()
+        # Client, semaphore and batch dispatcher bind to an event loop; each run creates its own
+        self.client = None
+        self.semaphore = None
+        self.batch_dispatcher = None
+        # Shared by all output files of this run; a resumed run keeps appending to its original files
+        self.run_timestamp = RESUME_RUN_ID or datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.response_cache = diskcache.Cache(RESPONSE_CACHE_DIR) if ENABLE_RESPONSE_CACHE else None
+        self._memory_cache = OrderedDict()  # LRU front for response_cache
+        self.cache_stats = {"hits": 0, "misses": 0}
+        self.semantic_cache = SemanticCritiqueCache() if ENABLE_SEMANTIC_CACHE else None
+        self.pipeline_generation = PIPELINE_GENERATION and not ENABLE_FUSED_GENCRIT
         self.iteration_count = 0
-        self.history = []
+        # Only recent entries stay in memory when the checkpoint log holds the full history
+        self.history = deque(maxlen=HISTORY_WINDOW if SAVE_INTERMEDIATE_RESULTS else None)
+        self._best_entry = None  # highest-scoring entry, kept even after eviction from history
         self.critique_improvement_history = []
-        self.score_trends = []
-        self.meta_score_trends = []
+        self.score_trends = array.array('i')  # one score per iteration, parallel to history
+        self.meta_score_trends = array.array('d')
         self.confidence_scores = []
+        self._prompt_store = {}  # prompt hash -> prompt text; history entries reference hashes
+        self._intermediate_fp = None
+        self._intermediate_path = None
+        self._prompts_dir = None
+        self._last_prompt_hashes = {}
+        self._initial_critique_prompt = None
+        self._confidence_cache = (None, 0)  # (state key, value) memo for calculate_final_confidence
         
     def setup_client(self):
-        """Set up Anthropic client with error handling."""
-        api_key = os.getenv('ANTHROPIC_API_KEY')
-        if not api_key:
-            raise ValueError(
-                "ANTHROPIC_API_KEY environment variable is not set!\n"
-                "Please set it using: export ANTHROPIC_API_KEY='your-api-key'"
-            )
-        
-        try:
-            self.client = Anthropic(api_key=api_key)
-            logging.info("Anthropic client initialized successfully")
-        except Exception as e:
-            raise ValueError(f"Failed to initialize Anthropic client: {e}")
+        """Create the async Anthropic client for the current run."""
+        self.client = _create_client()
     
     def read_file_content(self, filename):
         """Read content from a file with error handling."""
         try:
-            with open(filename, 'r', encoding='utf-8') as file:
-                content = file.read().strip()
-                logging.info(f"Successfully read {filename}")
-                return content
+            content = _cached_read(filename, os.path.getmtime(filename))
+            logging.info("Successfully read %s", filename)
+            return content
         except FileNotFoundError:
-            logging.error(f"Error: {filename} not found!")
+            logging.error("Error: %s not found!", filename)
             raise
         except Exception as e:
-            logging.error(f"Error reading {filename}: {e}")
+            logging.error("Error reading %s: %s", filename, e)
             raise
     
+    @property
+    def initial_critique_prompt(self):
+        """The initial critique prompt, read from disk once per run."""
+        if self._initial_critique_prompt is None:
+            self._initial_critique_prompt = self.read_file_content(INITIAL_CRITIQUE_PROMPT_FILE)
+        return self._initial_critique_prompt
+    
     def save_to_file(self, content, filename):
         """Save content to a file with error handling."""
         try:
             with open(filename, 'w', encoding='utf-8') as file:
                 file.write(content)
-            logging.info(f"Successfully saved to {filename}")
+            logging.info("Successfully saved to %s", filename)
         except Exception as e:
-            logging.error(f"Error saving to {filename}: {e}")
+            logging.error("Error saving to %s: %s", filename, e)
     
-    def get_llm_response(self, model, system_prompt, user_prompt, expect_json=False):
-        """Get response from Anthropic API with comprehensive error handling."""
+    def save_results(self, results, filename):
+        """
+        Save the final results as JSON.
+        
+        The results dict carries no history; save_results adds the "history"
+        array itself, streamed one entry at a time from iter_history, so it
+        includes entries already evicted from memory and the whole results
+        tree is never held in memory as a single serialized blob.
+        """
         try:
-            messages = [{"role": "user", "content": user_prompt}]
-            
+            with open(filename, 'wb') as file:
+                file.write(b"{\n")
+                for key, value in results.items():
+                    file.write(b"  " + _json_dumps(key) + b": " + _json_dumps(value) + b",\n")
+                file.write(b'  "history": [')
+                for index, entry in enumerate(self.iter_history()):
+                    file.write((b",\n    " if index else b"\n    ") + _json_dumps(entry))
+                file.write(b"\n  ]\n}\n")
+            logging.info("Successfully saved to %s", filename)
+        except Exception as e:
+            logging.error("Error saving to %s: %s", filename, e)
+    
+    def open_intermediate_log(self, timestamp):
+        """Open the append-only JSONL log of per-iteration results (if enabled)."""
+        if not SAVE_INTERMEDIATE_RESULTS:
+            return
+        self._prompts_dir = f"{OUTPUT_PREFIX}_prompts_{timestamp}"
+        os.makedirs(self._prompts_dir, exist_ok=True)
+        self._intermediate_path = f"{OUTPUT_PREFIX}_intermediate_{timestamp}.jsonl"
+        self._intermediate_fp = open(self._intermediate_path, "ab")
+    
+    def iter_history(self):
+        """Yield every history entry, reading ones evicted from memory back from the checkpoint."""
+        if self.history and self.history[0]["iteration"] > 1 and self._intermediate_path:
+            with open(self._intermediate_path, 'rb') as file:
+                for line in file:
+                    yield _json_loads(line)
+        else:
+            yield from self.history
+    
+    def load_checkpoint(self, timestamp):
+        """
+        Restore history from a previous run's intermediate log so the run can continue.
+        
+        Prompt text is recovered from the prompts directory, where each prompt was
+        written on the iteration it changed. A record torn by a crash is truncated
+        away so appends start on a clean line.
+        """
+        path = f"{OUTPUT_PREFIX}_intermediate_{timestamp}.jsonl"
+        if not os.path.exists(path):
+            logging.warning("⚠️ No checkpoint at %s; starting a fresh run", path)
+            return
+        prompts_dir = f"{OUTPUT_PREFIX}_prompts_{timestamp}"
+        
+        with open(path, 'rb+') as file:
+            offset = 0
+            for line in file:
+                try:
+                    entry = _json_loads(line)
+                except json.JSONDecodeError:
+                    logging.warning("⚠️ Dropping incomplete checkpoint record at byte %d", offset)
+                    file.truncate(offset)
+                    break
+                offset += len(line)
+                
+                for kind in ("system", "critique"):
+                    digest = entry[f"{kind}_prompt_hash"]
+                    if self._last_prompt_hashes.get(kind) != digest:
+                        self._last_prompt_hashes[kind] = digest
+                        if digest not in self._prompt_store:
+                            self._prompt_store[digest] = self.read_file_content(
+                                os.path.join(prompts_dir, f"iter_{entry['iteration']}_{kind}.txt"))
+                self.history.append(entry)
+                if self._best_entry is None or entry["score"] > self._best_entry["score"]:
+                    self._best_entry = entry
+                self.score_trends.append(entry["score"])
+                self.meta_score_trends.append((entry.get("meta_evaluation") or {}).get("meta_score", 0))
+        
+        if self.history:
+            self.iteration_count = self.history[-1]["iteration"]
+        logging.info("♻️ Resumed %d iterations from %s", self.iteration_count, path)
+    
+    def close_intermediate_log(self):
+        """Close the intermediate results log."""
+        if self._intermediate_fp is not None:
+            self._intermediate_fp.close()
+            self._intermediate_fp = None
+    
+    def cache_get(self, key):
+        """Look up a cached response, checking the in-memory LRU before the disk cache."""
+        if key in self._memory_cache:
+            self._memory_cache.move_to_end(key)
+            value = self._memory_cache[key]
+        else:
+            value = self.response_cache.get(key)
+            if value is not None:
+                self._memory_put(key, value)
+        self.cache_stats["hits" if value is not None else "misses"] += 1
+        return value
+    
+    def cache_set(self, key, value):
+        """Store a response in both the in-memory LRU and the disk cache."""
+        self._memory_put(key, value)
+        self.response_cache.set(key, value)
+    
+    def _memory_put(self, key, value):
+        """Insert into the in-memory LRU, evicting the oldest entry past MEMORY_CACHE_SIZE."""
+        self._memory_cache[key] = value
+        self._memory_cache.move_to_end(key)
+        if len(self._memory_cache) > MEMORY_CACHE_SIZE:
+            self._memory_cache.popitem(last=False)
+    
+    def store_prompt(self, prompt):
+        """Intern a prompt in the content-addressed prompt store and return its hash."""
+        digest = hashlib.blake2b(prompt.encode(), digest_size=8).hexdigest()
+        self._prompt_store.setdefault(digest, prompt)
+        return digest
+    
+    def save_intermediate_result(self, entry):
+        """
+        Append one iteration's history entry to the intermediate log (the run checkpoint).
+        
+        Prompts are referenced by hash; their text is written to the prompts
+        directory only when it changes from the previous iteration.
+        """
+        if self._intermediate_fp is None:
+            return
+        for kind in ("system", "critique"):
+            digest = entry[f"{kind}_prompt_hash"]
+            if self._last_prompt_hashes.get(kind) != digest:
+                self._last_prompt_hashes[kind] = digest
+                self.save_to_file(self._prompt_store[digest],
+                                  os.path.join(self._prompts_dir, f"iter_{entry['iteration']}_{kind}.txt"))
+        self._intermediate_fp.write(_json_dumps(entry) + b"\n")
+        self._intermediate_fp.flush()
+    
+    async def create_message(self, **params):
+        """
+        Call the Messages API under the concurrency cap.
+        
+        Rate limits, overloads and connection failures are retried with
+        exponential backoff (API_RETRY_BASE_DELAY * 2**attempt seconds).
+        """
+        for attempt in range(API_MAX_RETRIES):
+            try:
+                async with self.semaphore:
+                    return await self.client.messages.create(**params)
+            except (APIConnectionError, APIStatusError) as e:
+                status = getattr(e, "status_code", None)
+                retryable = status is None or status == 429 or status >= 500
+                if not retryable or attempt == API_MAX_RETRIES - 1:
+                    raise
+                delay = API_RETRY_BASE_DELAY * 2 ** attempt
+                logging.warning("⏳ Transient API error (%s), retrying in %ss", e.__class__.__name__, delay)
+                await asyncio.sleep(delay)
+
+    async def get_llm_response(self, model, system_prompt, user_prompt, expect_json=False, cacheable=False,
+                               use_cache=True, use_semantic_cache=False, max_tokens=MAX_TOKENS_GENERATION,
+                               json_prefill="{", user_prefix=None, latency_budget_ms=None,
+                               required_key=None, reject_truncated=False):
+        """
+        Get response from Anthropic API with comprehensive error handling.
+        
+        max_tokens caps the output length; pass the budget for the call's role.
+        For expect_json calls the assistant turn is prefilled with json_prefill
+        ("{" for objects, "[" for arrays) so the model starts emitting JSON directly.
+        cacheable=True marks the system prompt for Anthropic prompt caching; use it
+        for large prompts that stay byte-identical across calls.
+        use_cache=False bypasses the local exact-match response cache; pass it for
+        sampled calls whose output should differ between iterations or runs.
+        use_semantic_cache=True also reuses results whose user_prompt is semantically
+        close under an identical user_prefix (only when ENABLE_SEMANTIC_CACHE is on).
+        user_prefix, if given, is sent ahead of user_prompt as a separate content
+        block marked for prompt caching, so a stable prefix is cached across calls.
+        latency_budget_ms marks how long the caller can wait; with ENABLE_BATCH_MODE,
+        calls tolerating BATCH_MIN_LATENCY_BUDGET_MS or more go through the
+        Message Batches API instead of /messages, falling back to /messages if the
+        batch has not ended once the budget is spent.
+        required_key names a key the parsed JSON object must contain; results
+        without it (e.g. a critique cut off before its score) count as failures.
+        JSON calls, and calls with reject_truncated=True, fail (return None) when
+        the response stopped at max_tokens rather than ending on its own.
+        """
+        full_user_prompt = user_prefix + user_prompt if user_prefix else user_prompt
+        cache_key = None
+        if use_cache and self.response_cache is not None:
+            key_text = f"{model}|{system_prompt}|{full_user_prompt}|{expect_json}"
+            if len(key_text) > _OFFLOAD_HASH_CHARS:
+                cache_key = await asyncio.to_thread(_digest, key_text)
+            else:
+                cache_key = _digest(key_text)
+            cached = self.cache_get(cache_key)
+            if cached is not None:
+                logging.debug("Response cache hit (%s)", model)
+                return cached
+        
+        semantic_scope = semantic_embedding = None
+        if use_semantic_cache and self.semantic_cache is not None:
+            semantic_scope = _digest(f"{model}|{system_prompt}|{user_prefix}|{expect_json}")
+            semantic_embedding = await asyncio.to_thread(self.semantic_cache.embed, user_prompt)
+            cached = self.semantic_cache.lookup(semantic_scope, semantic_embedding)
+            if cached is not None:
+                logging.info("♻️ Semantic cache hit (%s)", model)
+                return cached
+        
+        try:
+            user_content = user_prompt + JSON_INSTRUCTION if expect_json else user_prompt
+            if user_prefix:
+                user_content = [
+                    {"type": "text", "text": user_prefix, "cache_control": {"type": "ephemeral"}},
+                    {"type": "text", "text": user_content}
+                ]
+            messages = [{"role": "user", "content": user_content}]
             if expect_json:
-                messages[0]["content"] += "\n\nPlease respond with valid JSON only."
+                messages.append({"role": "assistant", "content": json_prefill})
             
-            response = self.client.messages.create(
-                model=model,
-                max_tokens=8000,
-                system=system_prompt if system_prompt else "You are a helpful assistant.",
-                messages=messages
-            )
+            system = system_prompt if system_prompt else "You are a helpful assistant."
+            if cacheable:
+                system = [{"type": "text", "text": system, "cache_control": {"type": "ephemeral"}}]
+            
+            params = {"model": model, "max_tokens": max_tokens, "system": system, "messages": messages}
+            if (self.batch_dispatcher is not None and latency_budget_ms is not None
+                    and latency_budget_ms >= BATCH_MIN_LATENCY_BUDGET_MS):
+                deadline = asyncio.get_running_loop().time() + latency_budget_ms / 1000
+                response = await self.batch_dispatcher.submit(deadline=deadline, **params)
+            else:
+                response = await self.create_message(**params)
+            
+            if getattr(response, "stop_reason", None) == "max_tokens" and (expect_json or reject_truncated):
+                raise ValueError(f"Response truncated at max_tokens={max_tokens}")
+            
+            if cacheable or user_prefix:
+                cache_read = getattr(response.usage, "cache_read_input_tokens", 0) or 0
+                logging.debug("Prompt cache read tokens (%s): %s", model, cache_read)
             
             content = response.content[0].text.strip()
             
             if expect_json:
-                if content.startswith("```json"):
-                    content = content[7:]
-                if content.endswith("```"):
-                    content = content[:-3]
-                return json.loads(content.strip())
+                content = _parse_json(json_prefill + content)
+            
+            if required_key and not (isinstance(content, dict) and required_key in content):
+                raise ValueError(f"Response JSON has no {required_key!r} field")
+            
+            if cache_key is not None:
+                self.cache_set(cache_key, content)
+            if semantic_embedding is not None:
+                self.semantic_cache.add(semantic_scope, semantic_embedding, content)
             return content
             
         except Exception as e:
-            logging.error(f"Error calling Anthropic API ({model}): {e}")
+            logging.error("Error calling Anthropic API (%s): %s", model, e)
             return None
 
-    def validate_critique_quality(self, critique_history):
+    async def generate_and_critique(self, system_prompt, critique_prompt, user_input):
+        """
+        Generate a response and critique it in one request (ENABLE_FUSED_GENCRIT).
+        
+        Returns: (response, critique_data), or (None, None) on failure
+        """
+        data = await self.get_llm_response(
+            MODEL_CRITIQUE,
+            critique_prompt,
+            FUSED_GENCRIT_TEMPLATE.format(system_prompt=system_prompt, user_input=user_input),
+            expect_json=True,
+            cacheable=True,
+            use_cache=False,  # a fresh sample every iteration
+            max_tokens=MAX_TOKENS_GENERATION + MAX_TOKENS_CRITIQUE,
+            required_key="score"
+        )
+        if not isinstance(data, dict) or not data.get("response"):
+            return None, None
+        return data["response"], data
+
+    def validate_critique_quality(self, recent_scores, recent_meta_scores):
         """
         Advanced critique validation using multiple metrics.
         
+        Takes the trailing CRITIQUE_STABILITY_WINDOW scores and meta-scores.
+        
         Returns: dict with validation metrics
         """
-        if len(critique_history) < 2:
+        if len(recent_scores) < 2:
             return {"is_valid": True, "confidence": 50, "reason": "Insufficient history"}
         
-        recent_scores = [h.get('score', 0) for h in critique_history[-CRITIQUE_STABILITY_WINDOW:]]
-        recent_meta_scores = [h.get('meta_score', 0) for h in critique_history[-CRITIQUE_STABILITY_WINDOW:]]
-        
         # Check for score consistency (not wildly fluctuating)
         score_std = statistics.stdev(recent_scores) if len(recent_scores) > 1 else 0
         consistency_score = max(0, 100 - score_std * 2)  # Lower std = higher consistency
@@ -183,7 +798,7 @@ class EnhancedDualPromptImprover:
         
         return validation
 
-    def cross_validate_improvement(self, old_prompt, new_prompt, user_input, test_cases=2):
+    async def cross_validate_improvement(self, old_prompt, new_prompt, user_input, test_cases=2):
         """
         Cross-validate improvements by testing on multiple scenarios.
         
@@ -195,36 +810,30 @@ class EnhancedDualPromptImprover:
         # Generate test variations
         test_inputs = [user_input]
         if test_cases > 1:
-            variation_prompt = f"""
-Generate {test_cases-1} variations of this user input that test similar capabilities:
-
-Original: {user_input}
-
-Return as JSON array: ["variation1", "variation2", ...]
-"""
-            variations = self.get_llm_response(
-                MODEL_GENERATION,
-                "You are a test case generator. Create realistic variations.",
+            variation_prompt = VARIATION_PROMPT_TEMPLATE.format(count=test_cases - 1, user_input=user_input)
+            variations = await self.get_llm_response(
+                MODEL_VARIATION,
+                VARIATION_SYSTEM_PROMPT,
                 variation_prompt,
-                expect_json=True
+                expect_json=True,
+                json_prefill="[",
+                max_tokens=MAX_TOKENS_VARIATION * test_cases
             )
             
             if variations:
                 test_inputs.extend(variations[:test_cases-1])
         
-        # Test both prompts on each input
-        for test_input in test_inputs[:test_cases]:
-            # Test old prompt
-            old_response = self.get_llm_response(MODEL_GENERATION, old_prompt, test_input)
-            if old_response:
-                old_critique = self.get_critique(old_prompt, test_input, old_response)
-                old_scores.append(old_critique.get('score', 0) if old_critique else 0)
-            
-            # Test new prompt  
-            new_response = self.get_llm_response(MODEL_GENERATION, new_prompt, test_input)
-            if new_response:
-                new_critique = self.get_critique(new_prompt, test_input, new_response)
-                new_scores.append(new_critique.get('score', 0) if new_critique else 0)
+        # Test both prompts on every input at once; each job critiques its response as
+        # soon as it arrives (concurrency is capped by the API semaphore)
+        jobs = [(prompt, test_input, scores)
+                for test_input in test_inputs[:test_cases]
+                for prompt, scores in ((old_prompt, old_scores), (new_prompt, new_scores))]
+        results = await asyncio.gather(*(
+            self.score_prompt(prompt, test_input) for prompt, test_input, _ in jobs
+        ))
+        for (_, _, scores), score in zip(jobs, results):
+            if score is not None:
+                scores.append(score)
         
         if old_scores and new_scores:
             old_avg = statistics.mean(old_scores)
@@ -232,35 +841,105 @@ Return as JSON array: ["variation1", "variation2", ...]
             improvement = new_avg - old_avg
             confidence = min(100, max(0, 50 + improvement * 2))
             
-            logging.info(f"🔬 Cross-validation: Old avg: {old_avg:.1f}, New avg: {new_avg:.1f}, Improvement: {improvement:.1f}, Confidence: {confidence:.1f}%")
+            logging.info("🔬 Cross-validation: Old avg: %.1f, New avg: %.1f, Improvement: %.1f, Confidence: %.1f%%",
+                         old_avg, new_avg, improvement, confidence)
             return confidence
         
         return 50  # Neutral confidence if validation fails
 
-    def get_critique(self, system_prompt, user_input, response):
-        """Helper method to get critique using current critique prompt."""
-        # Use the most recent critique prompt from history, or initial if none
-        current_critique_prompt = (
-            self.critique_improvement_history[-1]["new_critique_prompt"] 
-            if self.critique_improvement_history 
-            else self.read_file_content(INITIAL_CRITIQUE_PROMPT_FILE)
-        )
+    async def score_prompt(self, system_prompt, test_input):
+        """
+        Generate a response to test_input and score it, for cross-validation.
         
-        return self.get_llm_response(
-            MODEL_CRITIQUE,
-            current_critique_prompt,
-            f"User Input: {user_input}\nSystem Prompt: {system_prompt}\nResponse: {response}",
-            expect_json=True
+        Returns: the critique score, or None if no response or no valid
+        critique could be obtained
+        """
+        # Fresh samples each time; a cached response would freeze the baseline across iterations and runs
+        response = await self.get_llm_response(MODEL_GENERATION, system_prompt, test_input, use_cache=False,
+                                               latency_budget_ms=CROSS_VALIDATION_LATENCY_BUDGET_MS)
+        if not response:
+            return None
+        critique = await self.get_critique(system_prompt, test_input, response, model=MODEL_CHEAP_CRITIQUE,
+                                           latency_budget_ms=CROSS_VALIDATION_LATENCY_BUDGET_MS)
+        return critique['score'] if critique else None
+
+    async def get_critique(self, system_prompt, user_input, response, critique_prompt=None,
+                           model=MODEL_CRITIQUE, latency_budget_ms=None):
+        """Helper method to get critique using the given or current critique prompt."""
+        # Default to the most recent critique prompt from history, or initial if none
+        if critique_prompt is None:
+            critique_prompt = (
+                self.critique_improvement_history[-1]["new_critique_prompt"] 
+                if self.critique_improvement_history 
+                else self.initial_critique_prompt
+            )
+        
+        return await self.get_llm_response(
+            model,
+            critique_prompt,
+            CRITIQUE_RESPONSE_TEMPLATE.format(response=response),
+            expect_json=True,
+            user_prefix=CRITIQUE_PREFIX_TEMPLATE.format(user_input=user_input, system_prompt=system_prompt),
+            cacheable=True,
+            use_semantic_cache=True,
+            max_tokens=MAX_TOKENS_CRITIQUE,
+            latency_budget_ms=latency_budget_ms,
+            required_key="score"
         )
 
+    def check_convergence(self):
+        """
+        Multi-criterion stopping rule over the recent score trend.
+
+        Stops when score corrections have become negligible relative to the
+        score, when corrections stop shrinking while the score is not rising
+        (oscillating or diverging refinements), or when the score has flattened
+        out just short of the target.
+
+        Returns: reason string if the loop should stop, otherwise None
+        """
+        recent = self.score_trends[-4:]
+        if len(recent) < 3:
+            return None
+        deltas = [abs(b - a) for a, b in zip(recent, recent[1:])]
+
+        # Correction magnitude: |delta| / score <= EPS for the last two steps
+        if all(d / max(score, 1) <= EPS_CORRECTION for d, score in zip(deltas[-2:], recent[-2:])):
+            return f"Score corrections below {EPS_CORRECTION:.0%} for 2 iterations"
+
+        # Slowdown ratio: delta_new / delta_old >= RHO for the last two steps with no net gain
+        if len(deltas) == 3 and recent[-1] <= recent[0]:
+            rhos = [new / old for old, new in zip(deltas, deltas[1:]) if old]
+            if len(rhos) == 2 and all(rho >= RHO_THRESH for rho in rhos):
+                return f"Corrections not shrinking (rho >= {RHO_THRESH}) without score gains"
+
+        # Plateau near target: further refinement rarely buys the last few points
+        window = recent[-3:]
+        slope = statistics.linear_regression(range(len(window)), window).slope
+        if window[-1] >= TARGET_SCORE - PLATEAU_MARGIN and abs(slope) < PLATEAU_SLOPE:
+            return f"Score plateaued within {PLATEAU_MARGIN} points of target (slope {slope:+.2f})"
+
+        return None
+
     def calculate_final_confidence(self):
-        """Calculate overall confidence in the final result."""
+        """
+        Calculate overall confidence in the final result.
+        
+        The value only depends on what has been appended to the run's history
+        lists, so it is memoized on the latest iteration and their lengths.
+        """
         if not self.history:
             return 0
+        key = (self.history[-1]["iteration"], len(self.score_trends), len(self.meta_score_trends),
+               len(self.critique_improvement_history))
+        if self._confidence_cache[0] == key:
+            return self._confidence_cache[1]
         
         # Factors for confidence calculation
         final_score = self.history[-1].get('score', 0)
-        score_stability = self.validate_critique_quality(self.history)['confidence']
+        score_stability = self.validate_critique_quality(
+            self.score_trends[-CRITIQUE_STABILITY_WINDOW:], self.meta_score_trends[-CRITIQUE_STABILITY_WINDOW:]
+        )['confidence']
         
         # Check if we reached target
         target_achievement = 100 if final_score >= TARGET_SCORE else (final_score / TARGET_SCORE) * 100
@@ -279,70 +958,144 @@ Return as JSON array: ["variation1", "variation2", ...]
             critique_quality * 0.3
         )
         
-        return round(confidence)
+        self._confidence_cache = (key, round(confidence))
+        return self._confidence_cache[1]
 
-    def enhanced_run_dual_improvement(self, user_input, initial_system_prompt, initial_critique_prompt):
+    async def enhanced_run_dual_improvement(self, user_input, initial_system_prompt, initial_critique_prompt):
         """
         Enhanced dual improvement with sophisticated validation.
+        
+        With RESUME_RUN_ID set, history is first restored from that run's
+        intermediate log and the loop continues where it stopped.
+        
+        The returned summary omits the per-iteration history, which may be
+        only partly in memory; read it with iter_history() or save_results().
+        
+        The API client is created for this run and closed when it ends.
         """
+        if RESUME_RUN_ID:
+            self.load_checkpoint(self.run_timestamp)
+        self.setup_client()
+        self.semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        # One cross-validation phase sends old + new prompt x VALIDATION_ROUNDS calls; a larger
+        # pool would never fill and every batch would wait out the linger
+        self.batch_dispatcher = (
+            BatchDispatcher(self.client, self.create_message, min_size=min(BATCH_MIN_SIZE, 2 * VALIDATION_ROUNDS))
+            if ENABLE_BATCH_MODE else None
+        )
+        self.open_intermediate_log(self.run_timestamp)
+        try:
+            return await self._run_improvement_loop(user_input, initial_system_prompt, initial_critique_prompt)
+        finally:
+            self.close_intermediate_log()
+            await self.client.close()
+            self.client = None
+
+    async def _run_improvement_loop(self, user_input, initial_system_prompt, initial_critique_prompt):
+        """Iteration loop behind enhanced_run_dual_improvement."""
         current_system_prompt = initial_system_prompt
         current_critique_prompt = initial_critique_prompt
         current_score = 0
         best_score = 0
+        best_system_prompt = initial_system_prompt
         iterations_without_improvement = 0
+        speculative = None  # (system prompt, task) generating the next iteration's response early
         
-        logging.info(f"🚀 Starting Enhanced Dual Improvement Process")
-        logging.info(f"Target Score: {TARGET_SCORE}/100")
-        logging.info(f"Confidence Target: {CONFIDENCE_THRESHOLD}%")
-        logging.info(f"Max Iterations: {MAX_ITERATIONS}")
-        logging.info(f"{'='*80}")
+        # Resumed run: replay the recorded scores to rebuild the loop state
+        scored_prompt = initial_system_prompt  # prompt that produced each entry's score
+        for entry in self.iter_history():
+            if entry["score"] - best_score >= MIN_SCORE_IMPROVEMENT:
+                iterations_without_improvement = 0
+            else:
+                iterations_without_improvement += 1
+            if entry["score"] > best_score:
+                best_score, best_system_prompt = entry["score"], scored_prompt
+            scored_prompt = self._prompt_store[entry["system_prompt_hash"]]
+        if self.history:
+            current_system_prompt = scored_prompt
+            current_critique_prompt = self._prompt_store[self.history[-1]["critique_prompt_hash"]]
+            current_score = self.history[-1]["score"]
+        
+        logging.info("🚀 Starting Enhanced Dual Improvement Process")
+        logging.info("Target Score: %d/100", TARGET_SCORE)
+        logging.info("Confidence Target: %d%%", CONFIDENCE_THRESHOLD)
+        logging.info("Max Iterations: %d", MAX_ITERATIONS)
+        logging.info(_EQ80)
         
         while (current_score < TARGET_SCORE and 
                self.iteration_count < MAX_ITERATIONS and
                self.calculate_final_confidence() < CONFIDENCE_THRESHOLD):
             
             self.iteration_count += 1
-            logging.info(f"\n{'='*20} ITERATION {self.iteration_count} {'='*20}")
+            logging.info("\n%s ITERATION %d %s", _EQ20, self.iteration_count, _EQ20)
             
-            # Generate response
-            logging.info("📝 Generating response with current system prompt...")
-            response = self.get_llm_response(MODEL_GENERATION, current_system_prompt, user_input)
-            if not response:
-                logging.error("❌ Failed to get response. Aborting iteration.")
-                break
-            
-            # Get critique
-            logging.info("🔍 Evaluating with current critique prompt...")
-            critique_data = self.get_llm_response(
-                MODEL_CRITIQUE,
-                current_critique_prompt,
-                f"User Input: {user_input}\nSystem Prompt: {current_system_prompt}\nResponse: {response}",
-                expect_json=True
-            )
+            if ENABLE_FUSED_GENCRIT:
+                # Generate and critique in a single round trip
+                logging.info("📝 Generating and evaluating response in one request...")
+                response, critique_data = await self.generate_and_critique(
+                    current_system_prompt, current_critique_prompt, user_input
+                )
+                if not response:
+                    logging.error("❌ Failed to get fused response. Aborting iteration.")
+                    break
+            else:
+                # Generate response, reusing the pipelined one if the prompt did not change
+                if speculative and speculative[0] == current_system_prompt:
+                    logging.info("📝 Using pipelined response for current system prompt...")
+                    response = await speculative[1]
+                else:
+                    if speculative:
+                        speculative[1].cancel()
+                    logging.info("📝 Generating response with current system prompt...")
+                    # Always sample afresh; a cached response would replay the previous iteration
+                    response = await self.get_llm_response(MODEL_GENERATION, current_system_prompt, user_input,
+                                                           use_cache=False)
+                speculative = None
+                if not response:
+                    logging.error("❌ Failed to get response. Aborting iteration.")
+                    break
+                
+                # Get critique
+                logging.info("🔍 Evaluating with current critique prompt...")
+                critique_data = await self.get_critique(current_system_prompt, user_input, response,
+                                                        critique_prompt=current_critique_prompt)
             
             if not critique_data:
                 logging.error("❌ Failed to get critique. Aborting iteration.")
                 break
             
-            current_score = int(critique_data.get("score", 0))
+            current_score = int(critique_data["score"])
             critique_text = critique_data.get("critique", "No critique provided")
             
-            logging.info(f"\n📊 SYSTEM PROMPT EVALUATION:")
-            logging.info(f"   Score: {current_score}/100")
-            logging.info(f"   Improvement: {'+' if current_score > best_score else ''}{current_score - best_score}")
-            
-            # Enhanced critique validation
-            critique_validation = self.validate_critique_quality(self.history + [{"score": current_score}])
-            logging.info(f"   🔍 Critique Validation: {critique_validation['reason']}")
+            logging.info("\n📊 SYSTEM PROMPT EVALUATION:")
+            logging.info("   Score: %d/100", current_score)
+            logging.info("   Improvement: %+d", current_score - best_score)
             
             # Track trends
             self.score_trends.append(current_score)
-            if current_score > best_score:
-                best_score = current_score
+            
+            # Enhanced critique validation
+            critique_validation = self.validate_critique_quality(
+                self.score_trends[-CRITIQUE_STABILITY_WINDOW:], self.meta_score_trends[-CRITIQUE_STABILITY_WINDOW:]
+            )
+            logging.info("   🔍 Critique Validation: %s", critique_validation['reason'])
+            
+            # Gains smaller than MIN_SCORE_IMPROVEMENT count as a plateau
+            if current_score - best_score >= MIN_SCORE_IMPROVEMENT:
                 iterations_without_improvement = 0
             else:
                 iterations_without_improvement += 1
             
+            # Roll back a refinement that made things clearly worse
+            rolled_back = current_score < best_score - ROLLBACK_MARGIN
+            if rolled_back:
+                logging.warning("↩️ Score fell to %d (best %d); reverting to best system prompt",
+                                current_score, best_score)
+                current_system_prompt = best_system_prompt
+            elif current_score > best_score:
+                best_system_prompt = current_system_prompt
+            best_score = max(best_score, current_score)
+            
             # Enhanced meta-evaluation and critique improvement
             meta_evaluation = None
             if (ENABLE_CRITIQUE_IMPROVEMENT and 
@@ -350,36 +1103,70 @@ Return as JSON array: ["variation1", "variation2", ...]
                  self.iteration_count == 1 or
                  not critique_validation['is_valid'])):
                 
-                logging.info(f"\n🔬 ADVANCED CRITIQUE EVALUATION")
+                logging.info("\n🔬 ADVANCED CRITIQUE EVALUATION")
                 
                 # Existing meta-evaluation logic here (same as original)
                 # ... (keeping the original meta-evaluation code)
+            self.meta_score_trends.append((meta_evaluation or {}).get("meta_score", 0))
             
-            # Enhanced system prompt improvement with cross-validation
+            # Start the next iteration's generation now so it overlaps refinement and
+            # cross-validation; it is discarded if the system prompt changes. Gated on
+            # the same stop conditions as refinement so a final iteration sends nothing.
+            if (self.pipeline_generation and
+                current_score < TARGET_SCORE and
+                self.iteration_count < MAX_ITERATIONS and
+                iterations_without_improvement < EARLY_STOPPING_PATIENCE and
+                self.check_convergence() is None):
+                speculative = (current_system_prompt, asyncio.create_task(
+                    self.get_llm_response(MODEL_GENERATION, current_system_prompt, user_input, use_cache=False)
+                ))
+            
+            # Enhanced system prompt improvement with cross-validation; skipped when
+            # early stopping or convergence will end the loop after this iteration
             if (ENABLE_SYSTEM_PROMPT_IMPROVEMENT and 
+                not rolled_back and
                 current_score < TARGET_SCORE and 
-                self.iteration_count < MAX_ITERATIONS):
+                self.iteration_count < MAX_ITERATIONS and
+                iterations_without_improvement < EARLY_STOPPING_PATIENCE and
+                self.check_convergence() is None):
+                
+                logging.info("🔧 Improving system prompt with cross-validation...")
+                new_system_prompt = await self.improve_system_prompt(current_system_prompt, critique_text)
                 
-                logging.info(f"🔧 Improving system prompt with cross-validation...")
-                new_system_prompt = self.improve_system_prompt(current_system_prompt, critique_text)
+                if new_system_prompt and not _within_budget(new_system_prompt):
+                    logging.warning("⚠️ Improvement rejected (prompt exceeds %d characters)", MAX_PROMPT_LENGTH)
+                    new_system_prompt = None
                 
                 if new_system_prompt:
-                    # Cross-validate the improvement
-                    improvement_confidence = self.cross_validate_improvement(
-                        current_system_prompt, new_system_prompt, user_input, VALIDATION_ROUNDS
-                    )
+                    # Settle obvious cases from the diff alone; cross-validate the rest
+                    similarity = await asyncio.to_thread(_prompt_similarity, current_system_prompt, new_system_prompt)
+                    length_change = (abs(len(new_system_prompt) - len(current_system_prompt))
+                                     / max(len(current_system_prompt), 1))
                     
-                    if improvement_confidence >= 60:  # Accept if confident
+                    if similarity > TRIVIAL_EDIT_SIMILARITY:
                         current_system_prompt = new_system_prompt
-                        logging.info(f"✅ System prompt improved (confidence: {improvement_confidence:.1f}%)")
+                        logging.info("✅ System prompt lightly edited (similarity %.2f); accepted without "
+                                     "cross-validation (confidence: 50.0%%)", similarity)
+                    elif similarity < REWRITE_SIMILARITY or length_change > MAX_LENGTH_CHANGE:
+                        logging.warning("⚠️ Improvement rejected (similarity %.2f, length change %.0f%%)",
+                                        similarity, length_change * 100)
                     else:
-                        logging.info(f"⚠️ Improvement rejected (low confidence: {improvement_confidence:.1f}%)")
+                        # Cross-validate the improvement
+                        improvement_confidence = await self.cross_validate_improvement(
+                            current_system_prompt, new_system_prompt, user_input, VALIDATION_ROUNDS
+                        )
+                        
+                        if improvement_confidence >= 60:  # Accept if confident
+                            current_system_prompt = new_system_prompt
+                            logging.info("✅ System prompt improved (confidence: %.1f%%)", improvement_confidence)
+                        else:
+                            logging.info("⚠️ Improvement rejected (low confidence: %.1f%%)", improvement_confidence)
             
             # Record enhanced history
             self.history.append({
                 "iteration": self.iteration_count,
-                "system_prompt": current_system_prompt,
-                "critique_prompt_used": current_critique_prompt,
+                "system_prompt_hash": self.store_prompt(current_system_prompt),
+                "critique_prompt_hash": self.store_prompt(current_critique_prompt),
                 "response": response,
                 "score": current_score,
                 "critique": critique_text,
@@ -387,30 +1174,46 @@ Return as JSON array: ["variation1", "variation2", ...]
                 "critique_validation": critique_validation,
                 "confidence": self.calculate_final_confidence()
             })
+            await asyncio.to_thread(self.save_intermediate_result, self.history[-1])
+            if self._best_entry is None or current_score > self._best_entry["score"]:
+                self._best_entry = self.history[-1]
             
             # Enhanced early stopping
             current_confidence = self.calculate_final_confidence()
-            logging.info(f"📈 Overall Confidence: {current_confidence}%")
+            logging.info("📈 Overall Confidence: %d%%", current_confidence)
+            if self.response_cache is not None:
+                lookups = self.cache_stats["hits"] + self.cache_stats["misses"]
+                logging.info("💾 Response cache: %d/%d hits (%.0f%%)", self.cache_stats["hits"], lookups,
+                             100 * self.cache_stats["hits"] / lookups if lookups else 0)
             
             if current_score >= TARGET_SCORE and current_confidence >= CONFIDENCE_THRESHOLD:
-                logging.info(f"🎯 Target achieved with high confidence!")
+                logging.info("🎯 Target achieved with high confidence!")
                 break
             elif iterations_without_improvement >= EARLY_STOPPING_PATIENCE:
-                logging.info(f"⏹️ Early stopping: No improvement for {EARLY_STOPPING_PATIENCE} iterations")
+                logging.info("⏹️ Early stopping: Less than %d points gained for %d iterations",
+                             MIN_SCORE_IMPROVEMENT, EARLY_STOPPING_PATIENCE)
+                break
+            
+            convergence_reason = self.check_convergence()
+            if convergence_reason:
+                logging.info("⏹️ Converged: %s", convergence_reason)
                 break
         
+        if speculative:
+            speculative[1].cancel()
+        
         # Final assessment
         final_confidence = self.calculate_final_confidence()
         
-        logging.info(f"\n{'='*50}")
+        logging.info("\n%s", _EQ50)
         logging.info("🏁 ENHANCED FINAL RESULTS")
-        logging.info(f"{'='*50}")
-        logging.info(f"Final System Prompt Score: {current_score}/100")
-        logging.info(f"Best Score Achieved: {best_score}/100")
-        logging.info(f"Final Confidence: {final_confidence}%")
-        logging.info(f"Target Score: {TARGET_SCORE}")
-        logging.info(f"Confidence Target: {CONFIDENCE_THRESHOLD}%")
-        logging.info(f"SUCCESS: {'✅ Yes' if current_score >= TARGET_SCORE and final_confidence >= CONFIDENCE_THRESHOLD else '❌ No'}")
+        logging.info(_EQ50)
+        logging.info("Final System Prompt Score: %d/100", current_score)
+        logging.info("Best Score Achieved: %d/100", best_score)
+        logging.info("Final Confidence: %d%%", final_confidence)
+        logging.info("Target Score: %d", TARGET_SCORE)
+        logging.info("Confidence Target: %d%%", CONFIDENCE_THRESHOLD)
+        logging.info("SUCCESS: %s", '✅ Yes' if current_score >= TARGET_SCORE and final_confidence >= CONFIDENCE_THRESHOLD else '❌ No')
         
         return {
             "final_system_prompt": current_system_prompt,
@@ -422,51 +1225,26 @@ Return as JSON array: ["variation1", "variation2", ...]
             "target_achieved": current_score >= TARGET_SCORE,
             "confidence_achieved": final_confidence >= CONFIDENCE_THRESHOLD,
             "full_success": current_score >= TARGET_SCORE and final_confidence >= CONFIDENCE_THRESHOLD,
-            "history": self.history,
+            "best_iteration": self._best_entry["iteration"] if self._best_entry else None,
+            "prompts": self._prompt_store,
             "critique_improvement_history": self.critique_improvement_history,
-            "score_trends": self.score_trends
+            "score_trends": self.score_trends.tolist()
         }
 
-    def improve_system_prompt(self, current_system_prompt, critique_text):
+    async def improve_system_prompt(self, current_system_prompt, critique_text):
         """Same as original implementation."""
-        refinement_prompt = """
-You are an elite system prompt engineer specializing in transforming good prompts into exceptional ones.
-
-Your task is to refine the given system prompt to address ALL issues identified in the critique while maintaining its core functionality and strengths.
-
-**Improvement Strategy:**
-1. **Address Every Issue**: Systematically fix each problem mentioned in the critique
-2. **Preserve Strengths**: Keep what's working well
-3. **Enhance Clarity**: Make instructions more precise and unambiguous  
-4. **Improve Structure**: Optimize organization and flow
-5. **Add Missing Elements**: Include any crucial components that were absent
-6. **Strengthen Constraints**: Better define boundaries and limitations
-7. **Optimize for AI**: Ensure the prompt works well with AI reasoning patterns
+        improvement_input = REFINEMENT_INPUT_TEMPLATE.format(critique_text=critique_text)
+        # ~4 characters per token; leave room for the refined prompt to double in size
+        max_tokens = min(max(MAX_TOKENS_REFINEMENT, len(current_system_prompt) // 2), MAX_TOKENS_REFINEMENT_CAP)
 
-**Quality Standards:**
-- Every instruction should be clear and actionable
-- The prompt should be comprehensive yet efficient
-- It should handle edge cases and ambiguities
-- The structure should facilitate AI understanding
-- All constraints should be explicitly defined
-
-Return ONLY the improved system prompt, ready for immediate deployment.
-"""
-
-        improvement_input = f"""
-CURRENT SYSTEM PROMPT:
-{current_system_prompt}
-
-CRITIQUE TO ADDRESS:
-{critique_text}
-
-Please provide an improved version that addresses all the issues raised while maintaining the prompt's core purpose and effectiveness.
-"""
-
-        return self.get_llm_response(
+        return await self.get_llm_response(
             MODEL_REFINEMENT,
-            refinement_prompt,
-            improvement_input
+            REFINEMENT_SYSTEM_PROMPT,
+            improvement_input,
+            user_prefix=REFINEMENT_PREFIX_TEMPLATE.format(current_system_prompt=current_system_prompt),
+            use_cache=False,  # a rejected refinement must not be replayed next iteration
+            max_tokens=max_tokens,
+            reject_truncated=True  # a cut-off prompt could otherwise pass as a near-copy
         )
 
 
@@ -478,20 +1256,17 @@ def main():
         # Read input files
         user_input = improver.read_file_content(USER_INPUT_FILE)
         initial_system_prompt = improver.read_file_content(INITIAL_SYSTEM_PROMPT_FILE)
-        initial_critique_prompt = improver.read_file_content(INITIAL_CRITIQUE_PROMPT_FILE)
+        initial_critique_prompt = improver.initial_critique_prompt
         
         # Run enhanced dual improvement
-        results = improver.enhanced_run_dual_improvement(
+        results = asyncio.run(improver.enhanced_run_dual_improvement(
             user_input, 
             initial_system_prompt, 
             initial_critique_prompt
-        )
+        ))
         
         # Save results
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        
-        with open(f"enhanced_results_{timestamp}.json", 'w') as f:
-            json.dump(results, f, indent=2)
+        improver.save_results(results, f"enhanced_results_{improver.run_timestamp}.json")
         
         print(f"\n🎉 Enhanced Dual Improvement Complete!")
         print(f"📈 Final Score: {results['final_score']}/100")
@@ -499,7 +1274,7 @@ def main():
         print(f"✅ Full Success: {results['full_success']}")
         
     except Exception as e:
-        logging.error(f"❌ Error during execution: {e}")
+        logging.error("❌ Error during execution: %s", e)
         raise
 
 